@@ -1,21 +1,28 @@
 import pandas as pd 
+import asyncio
 import time
 import glob
 
 # relative import 
-from openai_batch_wrapper.batch_manager import BatchManager
+from openai_batch_wrapper.batch_manager import BatchManager, submit_batches
 
 job_paths = glob.glob("output_data/small_scale_random_200k/jsonl/job_*.jsonl")
 
-for job_path in job_paths:
-    batch_manager = BatchManager(
+batch_managers = [
+    BatchManager(
         job_id=job_path.split("/")[-1].split(".")[0],
         input_jsonl_path=job_path,
         batch_task_reset=False
     )
+    for job_path in job_paths
+]
 
-    batch_manager.upload_file()
-    batch_manager.create_batch()
+# upload the files and create the batches concurrently
+try:
+    asyncio.run(submit_batches(batch_managers, max_concurrency=8))
+finally:
+    for batch_manager in batch_managers:
+        batch_manager.close()
 
 
-# batch_manager.cancel_batch()
\ No newline at end of file
+# batch_manager.cancel_batch()
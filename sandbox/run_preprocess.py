@@ -1,23 +1,34 @@
-import pandas as pd
-from openai_batch_wrapper.preprocess import preprocess_dataframe
+import numpy as np
+import pyarrow.parquet as pq
+from pathlib import Path
+from openai_batch_wrapper.preprocess import preprocess_dataframe, reservoir_sample
 
-# load in the data
-df = pd.read_parquet('input_data/question_transcripts_with_employer.parquet')
-print('before dropping null companyid', len(df))
-# get rid of the questions that are too short
-df = df[df['componenttext'].str.len() > 100]
-# drop the row where companyid is null
-df = df[df['companyid'].notna()]
-print('after dropping null companyid and too short questions', len(df))
-# get top 10000 questions
-df = df.sample(200000, random_state=42, replace=False)
+SAMPLE_SIZE = 200000
+PROMPT = Path('input_data/prompts.txt').read_text()
+
+# load in the data, streaming row groups and reservoir-sampling them so that
+# only ~SAMPLE_SIZE rows are ever held in memory
+pf = pq.ParquetFile('input_data/question_transcripts_with_employer.parquet')
+print('before dropping null companyid', pf.metadata.num_rows)
+
+def filtered_chunks():
+    for batch in pf.iter_batches(batch_size=100_000, columns=['componenttext', 'companyid', 'transcriptid', 'companyname', 'proid']):
+        chunk = batch.to_pandas()
+        # get rid of the questions that are too short
+        chunk = chunk[chunk['componenttext'].str.len() > 100]
+        # drop the row where companyid is null
+        yield chunk[chunk['companyid'].notna()]
+
+# random sample of 200000 questions
+df, n_seen = reservoir_sample(filtered_chunks(), SAMPLE_SIZE, np.random.default_rng(42))
+print('after dropping null companyid and too short questions', n_seen)
 print(df.head())
 
 
 # preprocess the data
 preprocess_dataframe(
     df=df, 
-    guiding_prompt=open('input_data/prompts.txt').read(), 
+    guiding_prompt=PROMPT, 
     content_col='componenttext',
     chunk_size=40000,
     output_dir='output_data/small_scale_random_200k/',
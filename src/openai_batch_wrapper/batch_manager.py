@@ -1,14 +1,27 @@
 import os
 import time
 import json
+import asyncio
+import hashlib
+import functools
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Union
 from datetime import datetime, timedelta
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI, RateLimitError
 from pathlib import Path
 import duckdb
 import pandas as pd
 from tqdm import tqdm
-from .logger import setup_logger
+from .logger import flush_logger, setup_logger
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
 
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -19,6 +32,95 @@ dotenv.load_dotenv()
 # Set up logger
 logger = setup_logger('batch_manager')
 
+@functools.lru_cache(maxsize=None)
+def _get_client(api_key: str) -> OpenAI:
+    """Return a process-wide OpenAI client for the given API key."""
+    return OpenAI(api_key=api_key)
+
+# columns of the batch_status table, in table order
+STATUS_COLUMNS = ["job_id", "openai_file_id", "openai_batch_id", "updated_at", "status", "message", "progress", "openai_output_file_id", "input_hash"]
+
+# batch statuses after which OpenAI no longer changes a batch
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+# batch statuses for which an earlier batch with the same input can stand in for a new one
+REUSABLE_STATUSES = ('validating', 'in_progress', 'finalizing', 'completed')
+
+_STATUS_VALUES = f"({', '.join(STATUS_COLUMNS)}) VALUES ({', '.join('?' * len(STATUS_COLUMNS))})"
+
+_HISTORY_INSERT = f"INSERT INTO batch_status {_STATUS_VALUES}"
+
+# merges a status row into the current state of its job in batch_status_latest: the IDs
+# keep their last non-null value, everything else follows the new row. The parameters are
+# the row's columns with job_id moved to the end; a job's first row is inserted instead
+_LATEST_UPDATE = """
+    UPDATE batch_status_latest SET
+        openai_file_id = COALESCE(?, openai_file_id),
+        openai_batch_id = COALESCE(?, openai_batch_id),
+        updated_at = ?,
+        status = ?,
+        message = ?,
+        progress = ?,
+        openai_output_file_id = COALESCE(?, openai_output_file_id),
+        input_hash = COALESCE(?, input_hash)
+    WHERE job_id = ?
+"""
+
+_LATEST_INSERT = f"INSERT INTO batch_status_latest {_STATUS_VALUES}"
+
+# the same merge applied to a whole history at once, for databases written before batch_status_latest existed
+_LATEST_BACKFILL = """
+    INSERT INTO batch_status_latest
+    SELECT
+        job_id,
+        arg_max(openai_file_id, updated_at),
+        arg_max(openai_batch_id, updated_at),
+        max(updated_at),
+        arg_max_null(status, updated_at),
+        arg_max_null(message, updated_at),
+        arg_max_null(progress, updated_at),
+        arg_max(openai_output_file_id, updated_at),
+        arg_max(input_hash, updated_at)
+    FROM batch_status
+    GROUP BY job_id
+"""
+
+# open DuckDB connections and the number of managers using each, per database file
+_dbs: Dict[str, list] = {}
+
+# database files whose schema has been set up by this process
+_initialized_dbs = set()
+
+# guards the shared connections and the schema setup, which are used by managers on all threads
+_db_lock = threading.RLock()
+
+def _acquire_db(db_path: str) -> duckdb.DuckDBPyConnection:
+    """Return the process-wide DuckDB connection of a database file, opening it for its first user."""
+    with _db_lock:
+        entry = _dbs.get(db_path)
+        if entry is None:
+            entry = _dbs[db_path] = [duckdb.connect(database=db_path), 0]
+        entry[1] += 1
+        return entry[0]
+
+def _release_db(db_path: str):
+    """Give up one use of a connection, closing it (and the file lock) when the last user is gone."""
+    with _db_lock:
+        entry = _dbs[db_path]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _dbs[db_path]
+            _initialized_dbs.discard(db_path)
+            entry[0].close()
+
+def _hash_file(path: str) -> str:
+    """Return the blake2b digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 class BatchManager:
     """
     A class to manage OpenAI batch processing operations.
@@ -55,15 +157,11 @@ class BatchManager:
                 raise FileNotFoundError(f"Input JSONL file {input_jsonl_path} not found")
             self.input_jsonl_path = input_jsonl_path
         
-        if self.input_jsonl_path:
-            with open(self.input_jsonl_path, 'r') as file:
-                self.input_jsonl = open(self.input_jsonl_path, "rb")
-        
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key must be provided or set as OPENAI_API_KEY environment variable")
         
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = _get_client(self.api_key)
 
         if output_path:
             os.makedirs(output_path, exist_ok=True)
@@ -73,44 +171,81 @@ class BatchManager:
             self.output_path = os.path.join(os.path.dirname(os.path.dirname(self.input_jsonl_path)), 'output')
             os.makedirs(self.output_path, exist_ok=True)
         
-        # Initialize DuckDB connection
+        # Initialize DuckDB connection, shared by all managers pointing at the same file
         if db_path:
-            self.db = duckdb.connect(database=os.path.join(os.path.dirname(db_path), 'batch_status.db'))
+            self.db_path = os.path.abspath(os.path.join(os.path.dirname(db_path), 'batch_status.db'))
         else:
-            self.db = duckdb.connect(database=os.path.join(self.output_path, 'batch_status.db'))
-        self._init_db(reset=batch_task_reset)
+            self.db_path = os.path.abspath(os.path.join(self.output_path, 'batch_status.db'))
+        # each manager works on its own cursor so managers can be used from different threads
+        self.db = _acquire_db(self.db_path).cursor()
+        try:
+            self._init_db(reset=batch_task_reset)
+        except Exception:
+            self.close()
+            raise
+        # rows recorded inside _batched_status_writes, written together when the block ends
+        self._pending_status_rows = None
 
-        if self.db.execute("SELECT COUNT(*) FROM batch_status WHERE job_id = ?", (self.job_id,)).fetchone()[0] > 0:
+        # one lookup of the job's current state instead of scanning the history per ID
+        latest = self.db.execute(
+            "SELECT openai_file_id, openai_batch_id, openai_output_file_id FROM batch_status_latest WHERE job_id = ?",
+            (self.job_id,)
+        ).fetchone()
+        if latest is not None:
             if self.verbose:
                 logger.info(f"Job {self.job_id} already exists in the database")
         else:
             if self.verbose:
                 logger.info(f"Job {self.job_id} does not exist in the database")
+            latest = (None, None, None)
 
-        try:
-            self.batch_input_file_id = [item for item in self.db.execute("SELECT openai_file_id FROM batch_status WHERE job_id = ?", (self.job_id,)).fetchall() if item[0] is not None][0][0]
-        except (IndexError, TypeError):
-            self.batch_input_file_id = None
+        self.batch_input_file_id, self.openai_batch_id, self.openai_output_file_id = latest
+        if self.batch_input_file_id is None:
             logger.info(f"No input file ID found for job {self.job_id}")
-
-        try:
-            self.openai_batch_id = [item for item in self.db.execute("SELECT openai_batch_id FROM batch_status WHERE job_id = ?", (self.job_id,)).fetchall() if item[0] is not None][0][0]
-        except (IndexError, TypeError):
-            self.openai_batch_id = None
+        if self.openai_batch_id is None:
             logger.info(f"No batch ID found for job {self.job_id}")
-
-        try:
-            self.openai_output_file_id = [item for item in self.db.execute("SELECT openai_output_file_id FROM batch_status WHERE job_id = ?", (self.job_id,)).fetchall() if item[0] is not None][0][0]
-        except (IndexError, TypeError):
-            self.openai_output_file_id = None
+        if self.openai_output_file_id is None:
             logger.info(f"No output file ID found for job {self.job_id}")
 
         
+    @functools.cached_property
+    def input_hash(self) -> Optional[str]:
+        """Content hash of the input, used to recognise resubmissions of the same file (read on first use)."""
+        return _hash_file(self.input_jsonl_path) if self.input_jsonl_path else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # a manager that is dropped without close() still frees the database file
+        if getattr(self, 'db', None) is not None:
+            self.close()
+
+    def close(self):
+        """Close the manager's database cursor and its use of the shared connection."""
+        if self.db is None:
+            return
+        self.db.close()
+        self.db = None
+        _release_db(self.db_path)
+
     def _init_db(self, reset: bool = False):
-        if reset:
-            self.db.execute("DROP TABLE IF EXISTS batch_status")
+        """Initialize the database schema if it doesn't exist, once per database file and process."""
+        with _db_lock:
+            if reset:
+                self.db.execute("DROP TABLE IF EXISTS batch_status")
+                self.db.execute("DROP TABLE IF EXISTS batch_status_latest")
+                _initialized_dbs.discard(self.db_path)
 
-        """Initialize the database schema if it doesn't exist."""
+            if self.db_path not in _initialized_dbs:
+                self._create_schema()
+                _initialized_dbs.add(self.db_path)
+
+    def _create_schema(self):
+        """Create the status tables, migrating databases written by older versions."""
         self.db.execute("""
             CREATE TABLE IF NOT EXISTS batch_status (
                 job_id VARCHAR,
@@ -120,9 +255,34 @@ class BatchManager:
                 status VARCHAR,
                 message VARCHAR,
                 progress CHAR(255),
-                openai_output_file_id VARCHAR
+                openai_output_file_id VARCHAR,
+                input_hash VARCHAR
             )
         """)
+        # databases created before input hashing was introduced lack the column
+        self.db.execute("ALTER TABLE batch_status ADD COLUMN IF NOT EXISTS input_hash VARCHAR")
+        self.db.execute("CREATE INDEX IF NOT EXISTS batch_status_job_id_idx ON batch_status (job_id)")
+
+        # batch_status is the append-only history, batch_status_latest holds the current state of each job
+        latest_exists = self.db.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'batch_status_latest'"
+        ).fetchone()[0] > 0
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS batch_status_latest (
+                job_id VARCHAR PRIMARY KEY,
+                openai_file_id VARCHAR,
+                openai_batch_id VARCHAR,
+                updated_at TIMESTAMP,
+                status VARCHAR,
+                message VARCHAR,
+                progress CHAR(255),
+                openai_output_file_id VARCHAR,
+                input_hash VARCHAR
+            )
+        """)
+        if not latest_exists:
+            # databases written before the table existed: derive it from the history
+            self.db.execute(_LATEST_BACKFILL)
         logger.debug("Initialized database schema")
         
     def _update_batch_status(self, status_data: Dict):
@@ -137,6 +297,7 @@ class BatchManager:
                 - status: Current status of the job
                 - error_message: Any error message (optional)
                 - updated_at: Timestamp of the update (optional, will be set if not provided)
+                - input_hash: Content hash of the input file (optional, only recorded by the submission steps)
         """
         # Ensure we have the required fields
         if 'job_id' not in status_data:
@@ -148,33 +309,74 @@ class BatchManager:
         if 'updated_at' not in status_data:
             status_data['updated_at'] = datetime.now()
             
-        # Convert the dictionary to a list of values in the correct order
-        values = [
+        # Convert the dictionary to a row of values in the table order
+        message = status_data.get('message')
+        values = (
             status_data.get('job_id'),
             status_data.get('openai_file_id'),
             status_data.get('openai_batch_id'),
             status_data.get('updated_at', datetime.now()),
             status_data.get('status'),
-            status_data.get('message'),
+            None if message is None else str(message),
             status_data.get('progress', None),
-            status_data.get('openai_output_file_id', None)
-        ]
+            status_data.get('openai_output_file_id', None),
+            status_data.get('input_hash')
+        )
         
-        # Insert the data directly
-        self.db.execute("""
-            INSERT INTO batch_status (
-                job_id,
-                openai_file_id,
-                openai_batch_id,
-                updated_at,
-                status,
-                message,
-                progress,   
-                openai_output_file_id
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, values)
+        if self._pending_status_rows is not None:
+            self._pending_status_rows.append(values)
+        else:
+            self._write_status_rows([values])
         
         logger.debug(f"Updated status for job {status_data['job_id']}: {status_data['status']}")
+
+    def _write_status_rows(self, rows: List[tuple]):
+        """Append status rows to the history and merge them into the latest state, in one transaction."""
+        self.db.begin()
+        try:
+            self.db.executemany(_HISTORY_INSERT, rows)
+            # a keyed update is several times cheaper than an upsert through INSERT ... ON CONFLICT
+            for row in rows:
+                updated = self.db.execute(_LATEST_UPDATE, row[1:] + row[:1]).fetchone()[0]
+                if not updated:
+                    self.db.execute(_LATEST_INSERT, row)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+    def _reuse_batch(self) -> bool:
+        """
+        Adopt the batch of an earlier job that was submitted with the same input file.
+
+        Returns:
+            bool: True if such a batch exists and is not failed, expired or cancelled
+        """
+        if not self.input_hash:
+            return False
+
+        latest = self.db.execute("""
+            SELECT job_id, openai_file_id, openai_batch_id, openai_output_file_id, status
+            FROM batch_status_latest
+            WHERE input_hash = ? AND job_id <> ? AND openai_batch_id IS NOT NULL
+            ORDER BY updated_at DESC
+            LIMIT 1
+        """, (self.input_hash, self.job_id)).fetchone()
+        if latest is None or latest[4] not in REUSABLE_STATUSES:
+            return False
+
+        previous_job_id, self.batch_input_file_id, self.openai_batch_id, self.openai_output_file_id, status = latest
+        self._update_batch_status({
+            'job_id': self.job_id,
+            'openai_file_id': self.batch_input_file_id,
+            'openai_batch_id': self.openai_batch_id,
+            'status': status,
+            'message': f'Reused batch of job {previous_job_id} with identical input',
+            'openai_output_file_id': self.openai_output_file_id,
+            'input_hash': self.input_hash,
+        })
+        logger.info(f"Job {self.job_id} reuses batch {self.openai_batch_id} of job {previous_job_id}")
+        return True
     
     def upload_file(self) -> str:
         """
@@ -186,19 +388,48 @@ class BatchManager:
         if self.batch_input_file_id:
             logger.info(f"File {self.batch_input_file_id} already uploaded")
             return self.batch_input_file_id
+        if self._reuse_batch():
+            return self.batch_input_file_id
 
         logger.info(f"Uploading file {self.input_jsonl_path} to OpenAI")
-        batch_input_file = self.client.files.create(file=self.input_jsonl, purpose='batch')
-        self.batch_input_file_id = batch_input_file.id
+        with open(self.input_jsonl_path, 'rb') as input_jsonl:
+            batch_input_file = self.client.files.create(file=input_jsonl, purpose='batch')
 
         # # mock the file id
-        # self.batch_input_file_id = "file-VDVo3XAov2WJC4jGyiP9Nd"
+        # batch_input_file.id = "file-VDVo3XAov2WJC4jGyiP9Nd"
+        return self._record_upload(batch_input_file)
+
+    async def aupload_file(self, async_client: AsyncOpenAI) -> str:
+        """
+        Upload a file to the OpenAI API without blocking the event loop.
+
+        Args:
+            async_client: AsyncOpenAI client used for the request
+
+        Returns:
+            str: File ID
+        """
+        if self.batch_input_file_id:
+            logger.info(f"File {self.batch_input_file_id} already uploaded")
+            return self.batch_input_file_id
+        if self._reuse_batch():
+            return self.batch_input_file_id
+
+        logger.info(f"Uploading file {self.input_jsonl_path} to OpenAI")
+        # given a path, the client reads the file in a worker thread instead of on the event loop
+        batch_input_file = await async_client.files.create(file=Path(self.input_jsonl_path), purpose='batch')
+        return self._record_upload(batch_input_file)
+
+    def _record_upload(self, batch_input_file) -> str:
+        """Store the ID of a freshly uploaded input file."""
+        self.batch_input_file_id = batch_input_file.id
         logger.info(f"File uploaded successfully with ID: {self.batch_input_file_id}")
         self._update_batch_status({
             'job_id': self.job_id,
             'openai_file_id': self.batch_input_file_id,
             'openai_batch_id': None,
             'status': 'uploaded',
+            'input_hash': self.input_hash,
         })
         return self.batch_input_file_id
 
@@ -212,6 +443,8 @@ class BatchManager:
         if self.openai_batch_id:
             logger.info(f"Batch {self.openai_batch_id} already created")
             return self.openai_batch_id
+        if self._reuse_batch():
+            return self.openai_batch_id
         
         logger.info("Creating new batch processing job")
         batch_object_response = self.client.batches.create(
@@ -219,9 +452,35 @@ class BatchManager:
             endpoint="/v1/chat/completions",
             completion_window="24h"
         )
-        
+        return self._record_batch(batch_object_response)
+
+    async def acreate_batch(self, async_client: AsyncOpenAI) -> str:
+        """
+        Create a new batch processing job without blocking the event loop.
+
+        Args:
+            async_client: AsyncOpenAI client used for the request
+
+        Returns:
+            str: Batch ID
+        """
+        if self.openai_batch_id:
+            logger.info(f"Batch {self.openai_batch_id} already created")
+            return self.openai_batch_id
+        if self._reuse_batch():
+            return self.openai_batch_id
+
+        logger.info("Creating new batch processing job")
+        batch_object_response = await async_client.batches.create(
+            input_file_id=self.batch_input_file_id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        return self._record_batch(batch_object_response)
+
+    def _record_batch(self, batch_object_response) -> str:
+        """Store the ID and initial status of a freshly created batch."""
         self.openai_batch_id = batch_object_response.id
-        current_time = datetime.now()
         
         # Store initial batch status
         self._update_batch_status({
@@ -229,6 +488,7 @@ class BatchManager:
             'openai_batch_id': self.openai_batch_id,
             'status': batch_object_response.status,
             'message': batch_object_response.errors,
+            'input_hash': self.input_hash,
         })
         
         logger.info(f"Created batch {self.openai_batch_id} with status: {batch_object_response.status}")
@@ -246,11 +506,44 @@ class BatchManager:
             Dict: Batch status
         """
         logger.info(f"Getting status for batch {self.openai_batch_id} for job {self.job_id}")
-        if self.openai_batch_id: # if the batch is created, get the status
-            batch_status = self.client.batches.retrieve(self.openai_batch_id)
-        else:
+        if not self.openai_batch_id:
             raise ValueError("Cannot get a valid batchid, please check if the batch is created!")
 
+        # a batch that already reached a terminal state will not change anymore, so only ask the
+        # API while the recorded status of this batch is still open. A terminal status is only
+        # trusted once it comes with its output file, or if the batch cannot have one, since
+        # statuses copied from another job or written locally may lack what OpenAI reports
+        latest = self.db.execute(
+            "SELECT openai_batch_id, status, openai_output_file_id FROM batch_status_latest WHERE job_id = ?",
+            (self.job_id,)
+        ).fetchone()
+        settled = (
+            latest is not None
+            and latest[0] == self.openai_batch_id
+            and latest[1] in TERMINAL_STATUSES
+            and (latest[2] is not None or latest[1] in ('failed', 'expired'))
+        )
+        if not settled:
+            self._record_status(self.client.batches.retrieve(self.openai_batch_id))
+
+        # return the latest history of this job in the batch_status.db
+        # only the three most recent rows, returned oldest first
+        status_output = self.db.execute("""
+            SELECT * FROM (
+                SELECT job_id, openai_file_id, openai_batch_id, updated_at, status, message, progress, openai_output_file_id
+                FROM batch_status
+                WHERE job_id = ?
+                ORDER BY updated_at DESC
+                LIMIT 3
+            )
+            ORDER BY updated_at
+        """, (self.job_id,)).df()
+        if self.verbose:
+            logger.info(f"Status output: {status_output}")
+        return status_output['status'].iloc[-1], status_output # in-progress or completed
+
+    def _record_status(self, batch_status):
+        """Store a batch object retrieved from the OpenAI API as the latest status of the job."""
         self.openai_output_file_id = batch_status.output_file_id
 
         self._update_batch_status({
@@ -261,31 +554,28 @@ class BatchManager:
             'progress': 'Completed: ' + str(batch_status.request_counts.completed) + ';' + 'Failed: ' + str(batch_status.request_counts.failed) + ';' + 'Total: ' + str(batch_status.request_counts.total),
             'openai_output_file_id': self.openai_output_file_id
         })
-        # return everything in the batch_status.db about this job
-        status_output = pd.DataFrame(self.db.execute("SELECT * FROM batch_status WHERE job_id = ?", (self.job_id,)).fetchall(), columns=["job_id", "openai_file_id", "openai_batch_id", "updated_at", "status", "message", "progress", "openai_output_file_id"]).tail(3)
-        if self.verbose:
-            logger.info(f"Status output: {status_output}")
-        return status_output['status'].iloc[-1], status_output # in-progress or completed
 
-    def _regulate_output(self, output_file: str) -> pd.DataFrame:
+    def _regulate_output(self, output_file: Union[str, bytes]) -> pd.DataFrame:
         """
         Regulate the output file to a pandas dataframe.
-        """
-        df = pd.read_json(output_file, lines=True)
-        flat_df = pd.json_normalize(df.to_dict(orient='records'))
-        flat_df.columns = [col.split('.')[-1] for col in flat_df.columns] # get rid of all prefix created due to json_normalize
 
-        flat_df['reponse_message'] = flat_df['choices'].apply(lambda x: x[0]['message']['content'])
-
-        # new columns to create to take the response message
-        expanded = flat_df['reponse_message'].apply(json.loads).apply(pd.Series)
-
-        # concat the expanded dataframe to the flat_df
-        flat_df = pd.concat([flat_df, expanded], axis=1)
-
-        # keep only the columns relevant to the job
-        flat_df = flat_df[['custom_id', 'model', 'prompt_tokens', 'completion_tokens'] + list(expanded.columns)]
-        return flat_df
+        Each line of the batch output becomes one row holding the request's custom_id,
+        model and token usage, followed by the fields of the JSON response message.
+        """
+        rows = []
+        for line in output_file.splitlines():
+            if not line.strip():
+                continue
+            record = _json_loads(line)
+            body = record['response']['body']
+            rows.append({
+                'custom_id': record['custom_id'],
+                'model': body['model'],
+                'prompt_tokens': body['usage']['prompt_tokens'],
+                'completion_tokens': body['usage']['completion_tokens'],
+                **_json_loads(body['choices'][0]['message']['content']),
+            })
+        return pd.DataFrame.from_records(rows)
 
     def get_output_file(self) -> str:
         """
@@ -296,16 +586,18 @@ class BatchManager:
         """
         if self.verbose:
             logger.info(f"Getting output file for job {self.job_id}")
-        output_file = self.client.files.content(self.openai_output_file_id)
+        # the raw bytes are both saved and parsed, without decoding them to a str first
+        output_bytes = self.client.files.content(self.openai_output_file_id).read()
 
         # save the output file to a local file
-        with open(os.path.join(self.output_path, f"output_{self.job_id}.jsonl"), "w") as f:
-            f.write(output_file.text)
+        with open(os.path.join(self.output_path, f"output_{self.job_id}.jsonl"), "wb") as f:
+            f.write(output_bytes)
 
-        df = self._regulate_output(output_file.text)
-        df.to_csv(os.path.join(self.output_path, f"output_{self.job_id}.csv"), index=False)
+        # parquet (instead of csv) lets the analysis read only the columns it needs
+        df = self._regulate_output(output_bytes)
+        df.to_parquet(os.path.join(self.output_path, f"output_{self.job_id}.parquet"), engine='pyarrow', compression='zstd', row_group_size=100_000, index=False)
 
-        return [os.path.join(self.output_path, f"output_{self.job_id}.csv"), os.path.join(self.output_path, f"output_{self.job_id}.jsonl")]
+        return [os.path.join(self.output_path, f"output_{self.job_id}.parquet"), os.path.join(self.output_path, f"output_{self.job_id}.jsonl")]
 
     def cancel_batch(self) -> bool:
         """
@@ -322,22 +614,160 @@ class BatchManager:
         self._update_batch_status({
             'job_id': self.job_id,
             'openai_batch_id': self.openai_batch_id,
-            'status': 'cancelled',
+            # OpenAI reports 'cancelled' only once the batch has wound down
+            'status': 'cancelling',
             'message': 'Batch cancelled by user'
         })
         logger.info(f"Successfully cancelled batch {self.openai_batch_id} for job {self.job_id}")
         return True
 
-    def delete_all_files(self) -> bool:
+    def delete_all_files(self, max_workers: int = 32, max_retries: int = 5) -> bool:
         """
         Delete all the files in openai.
+
+        Args:
+            max_workers: Number of files deleted concurrently
+            max_retries: Attempts per file when rate limited, with exponential backoff
         """
         logger.info(f"Deleting all files in openai")
 
         # get all the files in openai
         files = self.client.files.list()
         logger.info(f"Found {len(files.data)} files in openai")
-        for file in tqdm(files.data, desc="Deleting files"):
-            self.client.files.delete(file.id)
 
-        return True
\ No newline at end of file
+        def delete_file(file_id):
+            for attempt in range(max_retries):
+                try:
+                    return self.client.files.delete(file_id)
+                except RateLimitError:
+                    if attempt == max_retries - 1:
+                        raise
+                    time.sleep(2 ** attempt)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            file_ids = [file.id for file in files.data]
+            list(tqdm(executor.map(delete_file, file_ids), total=len(file_ids), desc="Deleting files"))
+
+        return True
+
+
+@contextlib.contextmanager
+def _batched_status_writes(managers: List[BatchManager]):
+    """Collect the status rows the managers record inside the block and write them in one transaction per database file."""
+    pending = {}
+    for manager in managers:
+        manager._pending_status_rows = pending.setdefault(manager.db_path, [])
+    try:
+        yield
+    finally:
+        writers = {}
+        for manager in managers:
+            manager._pending_status_rows = None
+            writers.setdefault(manager.db_path, manager)
+        for db_path, rows in pending.items():
+            if rows:
+                writers[db_path]._write_status_rows(rows)
+
+
+@contextlib.asynccontextmanager
+async def _async_clients(managers: List[BatchManager]):
+    """Yield one AsyncOpenAI client per distinct API key of the managers, closing them afterwards."""
+    async_clients = {api_key: AsyncOpenAI(api_key=api_key) for api_key in {manager.api_key for manager in managers}}
+    try:
+        yield async_clients
+    finally:
+        for async_client in async_clients.values():
+            await async_client.close()
+
+
+async def upload_files(managers: List[BatchManager], max_concurrency: int = 8) -> List[str]:
+    """
+    Upload the input files of several jobs concurrently.
+
+    Args:
+        managers: BatchManagers of the jobs whose input files to upload
+        max_concurrency: Maximum number of uploads in flight at once
+
+    Returns:
+        list: File IDs, in the same order as managers
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with _async_clients(managers) as async_clients:
+        async def upload_one(manager: BatchManager) -> str:
+            async with semaphore:
+                return await manager.aupload_file(async_clients[manager.api_key])
+
+        return list(await asyncio.gather(*[upload_one(manager) for manager in managers]))
+
+
+async def submit_batches(managers: List[BatchManager], max_concurrency: int = 8) -> List[str]:
+    """
+    Upload the input files and create the batches of several jobs concurrently.
+
+    Args:
+        managers: BatchManagers of the jobs to submit
+        max_concurrency: Maximum number of jobs talking to the OpenAI API at once
+
+    Returns:
+        list: Batch IDs, in the same order as managers
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    # the IDs of the uploaded files and created batches are written once all jobs are
+    # submitted, or as soon as one of them fails
+    async with _async_clients(managers) as async_clients:
+        async def submit_one(manager: BatchManager) -> str:
+            async with semaphore:
+                async_client = async_clients[manager.api_key]
+                await manager.aupload_file(async_client)
+                return await manager.acreate_batch(async_client)
+
+        with _batched_status_writes(managers):
+            return list(await asyncio.gather(*[submit_one(manager) for manager in managers]))
+
+
+async def poll_all(managers: List[BatchManager], interval: float = 30, max_concurrency: int = 8) -> Dict[str, str]:
+    """
+    Poll the batches of several jobs concurrently until all of them reach a terminal status.
+
+    Every tick retrieves all unfinished batches at once and writes their statuses
+    to the database in a single transaction.
+
+    Args:
+        managers: BatchManagers of jobs whose batches are created
+        interval: Seconds to wait between two ticks
+        max_concurrency: Maximum number of concurrent requests to the OpenAI API
+
+    Returns:
+        dict: Final batch status by job ID
+    """
+    missing = [manager.job_id for manager in managers if not manager.openai_batch_id]
+    if missing:
+        raise ValueError(f"Cannot get a valid batchid for jobs {missing}, please check if the batches are created!")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    statuses = {}
+    pending = list(managers)
+
+    async with _async_clients(managers) as async_clients:
+        async def retrieve(manager: BatchManager):
+            async with semaphore:
+                return await async_clients[manager.api_key].batches.retrieve(manager.openai_batch_id)
+
+        while pending:
+            batch_statuses = await asyncio.gather(*[retrieve(manager) for manager in pending])
+            with _batched_status_writes(pending):
+                for manager, batch_status in zip(pending, batch_statuses):
+                    manager._record_status(batch_status)
+                    statuses[manager.job_id] = batch_status.status
+
+            pending = [manager for manager in pending if statuses[manager.job_id] not in TERMINAL_STATUSES]
+            if pending:
+                logger.info(f"{len(pending)} of {len(managers)} batches still running, polling again in {interval}s")
+            # a poll can run for a day, keep the log file current between the ticks
+            flush_logger(logger)
+            if pending:
+                await asyncio.sleep(interval)
+
+    return statuses
@@ -1,5 +1,6 @@
 import logging
 import sys
+from logging.handlers import MemoryHandler
 from pathlib import Path
 from datetime import datetime
 
@@ -49,14 +50,26 @@ def setup_logger(name: str, log_file: str = None, level=logging.INFO):
     log_path = Path(log_file).parent
     log_path.mkdir(parents=True, exist_ok=True)
     
-    # Add file handler
-    file_handler = logging.FileHandler(log_file)
+    # Add file handler, opened on the first write and fed in batches of records
+    # (warnings and errors are written right away, the rest on flush_logger or when logging shuts down)
+    file_handler = logging.FileHandler(log_file, delay=True)
     file_handler.setFormatter(file_formatter)
-    logger.addHandler(file_handler)
+    buffered_file_handler = MemoryHandler(capacity=1024, flushLevel=logging.WARNING, target=file_handler)
+    logger.addHandler(buffered_file_handler)
     
     logger.info(f"Logging to file: {log_file}")
     
     return logger
 
+def flush_logger(logger: logging.Logger):
+    """
+    Write the records a logger has buffered for its log file.
+
+    Args:
+        logger (logging.Logger): Logger set up by setup_logger
+    """
+    for handler in logger.handlers:
+        handler.flush()
+
 # Create a default logger instance
 logger = setup_logger('openai_batch_wrapper') 
\ No newline at end of file
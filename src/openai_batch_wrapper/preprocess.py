@@ -3,20 +3,65 @@
 # 2. index each row and index the job. 
 # 3. save the indexed and chunked jobs somewhere.
 
+import numpy as np
 import pandas as pd
-import uuid
 import os
 import json
+import functools
 import tiktoken
+from concurrent.futures import ThreadPoolExecutor
 from .logger import logger
 
-def num_tokens_from_messages(messages, model="gpt-4"):
-    """Returns the number of tokens used by a list of messages."""
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None
+
+def _json_value(value):
+    """Serialize a JSON value to bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode('utf-8')
+
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+def _uuid4_strings(n):
+    """Return n random version 4 UUID strings, formatted in one vectorized pass."""
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0f) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3f) | 0x80  # RFC 4122 variant
+
+    hex_digits = np.empty((n, 32), dtype=np.uint8)
+    hex_digits[:, 0::2] = _HEX_DIGITS[raw >> 4]
+    hex_digits[:, 1::2] = _HEX_DIGITS[raw & 0x0f]
+
+    # 8-4-4-4-12 layout
+    chars = np.full((n, 36), ord('-'), dtype=np.uint8)
+    chars[:, 0:8] = hex_digits[:, 0:8]
+    chars[:, 9:13] = hex_digits[:, 8:12]
+    chars[:, 14:18] = hex_digits[:, 12:16]
+    chars[:, 19:23] = hex_digits[:, 16:20]
+    chars[:, 24:36] = hex_digits[:, 20:32]
+    return chars.view('S36').ravel().astype(str)
+
+def _write_jsonl(jsonl_path, lines):
+    """Write serialized JSONL lines to a file through a 1 MiB buffer."""
+    with open(jsonl_path, 'wb', buffering=1 << 20) as f:
+        f.writelines(lines)
+    return jsonl_path
+
+@functools.lru_cache(maxsize=8)
+def _get_encoding(model):
+    """Return the tiktoken encoding of a model, looked up once per process."""
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        return tiktoken.encoding_for_model(model)
     except KeyError:
         logger.warning("Model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+
+def num_tokens_from_messages(messages, model="gpt-4"):
+    """Returns the number of tokens used by a list of messages."""
+    encoding = _get_encoding(model)
     
     num_tokens = 0
     for message in messages:
@@ -28,6 +73,60 @@ def num_tokens_from_messages(messages, model="gpt-4"):
     num_tokens += 2  # every reply is primed with <im_start>assistant
     return num_tokens
 
+def reservoir_sample(chunks, sample_size, rng):
+    """
+    Draw a uniform random sample of rows from a stream of DataFrames, holding
+    only ~2 * sample_size rows in memory at any time.
+
+    Args:
+        chunks (iterable of pandas.DataFrame): The DataFrames to sample from, in order.
+        sample_size (int): The number of rows to draw.
+        rng (numpy.random.Generator): The source of randomness.
+    Returns:
+        tuple: The sampled rows as one DataFrame and the number of rows seen
+    """
+    pieces = []  # the row slices that entered the reservoir
+    slot_piece = np.empty(sample_size, dtype=np.int64)  # which piece each reservoir slot points into
+    slot_row = np.empty(sample_size, dtype=np.int64)  # and which row of that piece
+    n_seen = 0
+
+    def gather_reservoir():
+        """Materialize the reservoir slots (in slot order) as one DataFrame."""
+        filled = min(n_seen, sample_size)
+        offsets = np.cumsum([0] + [len(piece) for piece in pieces[:-1]])
+        return pd.concat(pieces).iloc[offsets[slot_piece[:filled]] + slot_row[:filled]]
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+
+        # reservoir sampling: the i-th surviving row takes slot i while the reservoir
+        # fills up, afterwards it replaces a uniformly drawn slot with probability k/(i+1)
+        positions = np.arange(n_seen, n_seen + len(chunk))
+        slots = np.where(positions < sample_size, positions, rng.integers(0, positions + 1))
+        rows = np.flatnonzero(slots < sample_size)
+        # if several rows of this batch hit the same slot, the last one wins
+        _, last = np.unique(slots[rows][::-1], return_index=True)
+        rows = rows[::-1][last]
+        n_seen += len(chunk)
+        if len(rows) == 0:
+            continue
+
+        pieces.append(chunk.iloc[rows])
+        slot_piece[slots[rows]] = len(pieces) - 1
+        slot_row[slots[rows]] = np.arange(len(rows))
+
+        # drop the rows that have since been evicted once they outweigh the reservoir
+        if sum(len(piece) for piece in pieces) > 2 * sample_size:
+            pieces = [gather_reservoir()]
+            filled = min(n_seen, sample_size)
+            slot_piece[:filled] = 0
+            slot_row[:filled] = np.arange(filled)
+
+    if not pieces:
+        return pd.DataFrame(), n_seen
+    return gather_reservoir(), n_seen
+
 def preprocess_dataframe(df, guiding_prompt, content_col, chunk_size=1000, output_dir='chunks', llm_model='gpt-4', structured_output_path=None):
     """
     Preprocess a DataFrame by chunking it, indexing rows and jobs, and saving the results as JSONL files.
@@ -51,7 +150,7 @@ def preprocess_dataframe(df, guiding_prompt, content_col, chunk_size=1000, outpu
     if content_col not in df.columns:
         raise ValueError(f"Content column {content_col} not found in DataFrame")
 
-    logger.info(f"Starting preprocessing with {len(df)} rows")
+    logger.info("Starting preprocessing with %d rows", len(df))
     
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
@@ -62,65 +161,89 @@ def preprocess_dataframe(df, guiding_prompt, content_col, chunk_size=1000, outpu
     df = df.reset_index(drop=True)
     
     # Add a unique identifier to each row
-    df['bash_custom_id'] = [str(uuid.uuid4()) for _ in range(len(df))]
+    df['bash_custom_id'] = _uuid4_strings(len(df))
 
     # Chunk the DataFrame
     df['job_id'] = df.index // chunk_size
 
     # save the dataframe to a parquet file so we can reference it later
     parquet_path = os.path.join(output_dir, 'indexed_input_data', 'indexed_df.parquet')
-    df.to_parquet(parquet_path)
-    logger.info(f"Saved indexed DataFrame to {parquet_path}")
-
-    # create the number of jsonlist based on the number of jobs
-    jsonlist = [[] for _ in range(len(df['job_id'].unique()))]
-    total_tokens = 0
-
-    for _, row in df.iterrows():
-        # load in prompt 
-        conversations = []
-        conversations.append({"role": "system", "content": guiding_prompt})
-        conversations.append({"role": "user", "content": row[content_col]})
-        
-        # Calculate tokens for this conversation
-        tokens = num_tokens_from_messages(conversations, model=llm_model)
-        total_tokens += tokens
-
-        if structured_output_path is not None:
-            jsonlist[row['job_id']].append({ 
-                "custom_id": str(row['bash_custom_id']),
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": llm_model,
-                    "temperature": 0,
-                    "messages": conversations,
-                    "response_format": {
-                        "type": "json_schema",
-                        "json_schema": json.load(open(structured_output_path))
-                    }
-                }
-            })
-        else:
-            jsonlist[row['job_id']].append({ 
-                "custom_id": str(row['bash_custom_id']),
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": llm_model,
-                    "temperature": 0,
-                    "messages": conversations,
-                }
-            })
-    
-    logger.info(f'Total estimated input tokens: {round(total_tokens/1000000, 2)} million tokens')
+    df.to_parquet(parquet_path, engine='pyarrow', compression='zstd', compression_level=3, use_dictionary=True)
+    logger.info("Saved indexed DataFrame to %s", parquet_path)
+
+    # build the parts shared by every request once
+    system_message = {"role": "system", "content": guiding_prompt}
+    response_format = None
+    if structured_output_path is not None:
+        with open(structured_output_path) as f:
+            response_format = {"type": "json_schema", "json_schema": json.load(f)}
+
+    contents = df[content_col].to_numpy()
+
+    # Estimate the input tokens the same way as num_tokens_from_messages, but encode the
+    # user contents in batches (in parallel, in tiktoken's Rust core) and the shared
+    # system message only once
+    encoding = _get_encoding(llm_model)
+    tokens_per_row = (
+        4 + len(encoding.encode("system")) + len(encoding.encode(guiding_prompt))
+        + 4 + len(encoding.encode("user"))
+        + 2
+    )
+    total_tokens = tokens_per_row * len(df)
+    for start in range(0, len(contents), 10000):
+        batch = contents[start:start + 10000].tolist()
+        total_tokens += sum(map(len, encoding.encode_batch(batch, num_threads=os.cpu_count() or 1)))
+
+    logger.info('Total estimated input tokens: %s million tokens', round(total_tokens/1000000, 2))
+
+    # The requests differ only in custom_id and the user content, so serialize one request
+    # with placeholders and cut it there: each line is then the static pieces (system prompt,
+    # schema, ...) joined with the two serialized values
+    custom_id_slot = 'custom_id-' + os.urandom(16).hex()
+    content_slot = 'content-' + os.urandom(16).hex()
+    body = {
+        "model": llm_model,
+        "temperature": 0,
+        "messages": [system_message, {"role": "user", "content": content_slot}],
+    }
+    if response_format is not None:
+        body["response_format"] = response_format
+    template = _json_value({
+        "custom_id": custom_id_slot,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body
+    }) + b'\n'
+    head, rest = template.split(_json_value(custom_id_slot))
+    middle, tail = rest.split(_json_value(content_slot))
+
+    def build_request(custom_id, content):
+        return b''.join((head, _json_value(str(custom_id)), middle, _json_value(content), tail))
+
+    # build the jsonlist of one job at a time and hand it to a writer thread right away,
+    # so only the jobs currently being written are held in memory
+    jsonl_paths = []
+    max_workers = 8
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+
+        def wait_oldest():
+            job_id, n_items, future = pending.pop(0)
+            logger.info('Job %s: %d items saved to %s', job_id, n_items, future.result())
 
-    # save jsonlists by job_id
-    for i, job_id in enumerate(df['job_id'].unique()):
-        jsonl_path = os.path.join(output_dir, 'jsonl', f'job_{job_id}.jsonl')
-        with open(jsonl_path, 'w') as f:
-            for item in jsonlist[i]:
-                f.write(json.dumps(item) + '\n')
-        logger.info(f'Job {job_id}: {len(jsonlist[i])} items saved to {jsonl_path}')
+        for job_id, job_df in df.groupby('job_id', sort=False):
+            jsonlist = [
+                build_request(custom_id, content)
+                for custom_id, content in zip(job_df['bash_custom_id'].to_numpy(), job_df[content_col].to_numpy())
+            ]
+            jsonl_path = os.path.join(output_dir, 'jsonl', f'job_{job_id}.jsonl')
+            jsonl_paths.append(jsonl_path)
+            pending.append((job_id, len(jsonlist), executor.submit(_write_jsonl, jsonl_path, jsonlist)))
+            del jsonlist
+            if len(pending) > max_workers:
+                wait_oldest()
+        while pending:
+            wait_oldest()
 
-    logger.info('Preprocessing completed successfully')
\ No newline at end of file
+    logger.info('Preprocessing completed successfully')
+    return jsonl_paths
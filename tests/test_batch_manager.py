@@ -0,0 +1,274 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import pandas as pd
+
+from openai_batch_wrapper.batch_manager import BatchManager
+
+class StubClient:
+    """Records the OpenAI calls of a manager and answers them with canned objects."""
+
+    def __init__(self, retrieved_status='completed', output_file_id='file-output'):
+        self.calls = []
+        self.retrieved_status = retrieved_status
+        self.output_file_id = output_file_id
+        self.files = SimpleNamespace(create=self.create_file)
+        self.batches = SimpleNamespace(create=self.create_batch, retrieve=self.retrieve_batch, cancel=self.cancel_batch)
+
+    def create_file(self, file, purpose):
+        self.calls.append(('files.create', file.name))
+        return SimpleNamespace(id=f'file-{len(self.calls)}')
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        self.calls.append(('batches.create', input_file_id))
+        return SimpleNamespace(id=f'batch-{len(self.calls)}', status='validating', errors=None)
+
+    def retrieve_batch(self, batch_id):
+        self.calls.append(('batches.retrieve', batch_id))
+        return SimpleNamespace(
+            status=self.retrieved_status,
+            output_file_id=self.output_file_id,
+            errors=None,
+            request_counts=SimpleNamespace(completed=2, failed=0, total=2),
+        )
+
+    def cancel_batch(self, batch_id):
+        self.calls.append(('batches.cancel', batch_id))
+
+    def names(self):
+        return [name for name, _ in self.calls]
+
+class BatchManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_path = os.path.join(self.tmp_dir, 'batch_status.db')
+
+    def write_input(self, name, content='{"custom_id": "a"}\n'):
+        path = os.path.join(self.tmp_dir, f'{name}.jsonl')
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def make_manager(self, job_id, client=None, input_jsonl_path=None):
+        manager = BatchManager(
+            job_id=job_id,
+            input_jsonl_path=input_jsonl_path or self.write_input(job_id),
+            output_path=self.tmp_dir,
+            api_key='test',
+            db_path=self.db_path,
+            verbose=False,
+        )
+        self.addCleanup(manager.close)
+        manager.client = client or StubClient()
+        return manager
+
+    def record(self, manager, **status_data):
+        manager._update_batch_status({'job_id': manager.job_id, **status_data})
+
+class TestGetBatchStatus(BatchManagerTestCase):
+
+    def submitted_manager(self, client=None):
+        manager = self.make_manager('job_0', client)
+        manager.openai_batch_id = 'batch-0'
+        self.record(manager, openai_batch_id='batch-0', status='validating')
+        return manager
+
+    def test_terminal_status_with_output_skips_the_api(self):
+        manager = self.submitted_manager()
+        self.record(manager, status='completed', openai_output_file_id='file-output')
+
+        status, history = manager.get_batch_status()
+
+        self.assertEqual(manager.client.calls, [])
+        self.assertEqual(status, 'completed')
+        self.assertListEqual(history['status'].tolist(), ['validating', 'completed'])
+
+    def test_terminal_status_without_output_asks_the_api(self):
+        manager = self.submitted_manager()
+        self.record(manager, status='completed')
+
+        status, _ = manager.get_batch_status()
+        self.assertEqual(manager.client.calls, [('batches.retrieve', 'batch-0')])
+        self.assertEqual((status, manager.openai_output_file_id), ('completed', 'file-output'))
+
+        # once the output file is recorded the status is settled
+        manager.get_batch_status()
+        self.assertEqual(len(manager.client.calls), 1)
+
+    def test_failed_and_expired_batches_are_settled_without_output(self):
+        for status in ('failed', 'expired'):
+            with self.subTest(status=status):
+                manager = self.make_manager(f'job_{status}')
+                manager.openai_batch_id = f'batch-{status}'
+                self.record(manager, openai_batch_id=f'batch-{status}', status=status)
+
+                self.assertEqual(manager.get_batch_status()[0], status)
+                self.assertEqual(manager.client.calls, [])
+
+    def test_open_status_asks_the_api(self):
+        manager = self.submitted_manager(StubClient(retrieved_status='in_progress', output_file_id=None))
+
+        status, history = manager.get_batch_status()
+
+        self.assertEqual(manager.client.names(), ['batches.retrieve'])
+        self.assertEqual(status, 'in_progress')
+        self.assertEqual(history['progress'].iloc[-1].strip(), 'Completed: 2;Failed: 0;Total: 2')
+
+    def test_cancelled_batch_is_polled_until_openai_reports_it(self):
+        manager = self.submitted_manager(StubClient(retrieved_status='cancelled', output_file_id=None))
+
+        manager.cancel_batch()
+        self.assertEqual(manager.db.execute("SELECT status FROM batch_status_latest").fetchone()[0], 'cancelling')
+
+        status, _ = manager.get_batch_status()
+        self.assertEqual(manager.client.names(), ['batches.cancel', 'batches.retrieve'])
+        self.assertEqual(status, 'cancelled')
+
+    def test_terminal_status_of_another_batch_asks_the_api(self):
+        manager = self.submitted_manager()
+        self.record(manager, status='completed', openai_output_file_id='file-output')
+        # the job was resubmitted as a new batch since
+        manager.openai_batch_id = 'batch-1'
+
+        manager.get_batch_status()
+
+        self.assertEqual(manager.client.calls, [('batches.retrieve', 'batch-1')])
+
+    def test_missing_batch_raises(self):
+        with self.assertRaises(ValueError):
+            self.make_manager('job_0').get_batch_status()
+
+class TestReuseBatch(BatchManagerTestCase):
+
+    def submit_donor(self, status='completed', output_file_id='file-output', job_id='job_0', content='{"custom_id": "a"}\n'):
+        donor = self.make_manager(job_id, input_jsonl_path=self.write_input(f'donor_{job_id}', content))
+        donor.upload_file()
+        donor.create_batch()
+        self.record(donor, openai_batch_id=donor.openai_batch_id, status=status, openai_output_file_id=output_file_id)
+        return donor
+
+    def test_duplicate_input_adopts_the_donor_ids(self):
+        donor = self.submit_donor()
+        self.assertEqual(donor.client.names(), ['files.create', 'batches.create'])
+
+        # a different path, but the same bytes
+        manager = self.make_manager('job_1', input_jsonl_path=self.write_input('copy'))
+        self.assertEqual(manager.upload_file(), donor.batch_input_file_id)
+        self.assertEqual(manager.create_batch(), donor.openai_batch_id)
+
+        self.assertEqual(manager.client.calls, [])
+        self.assertEqual(manager.openai_output_file_id, 'file-output')
+        latest = manager.db.execute("""
+            SELECT openai_file_id, openai_batch_id, status, openai_output_file_id, input_hash
+            FROM batch_status_latest WHERE job_id = 'job_1'
+        """).fetchone()
+        self.assertEqual(latest, (donor.batch_input_file_id, donor.openai_batch_id, 'completed', 'file-output', donor.input_hash))
+
+        # the adopted output file settles the status without asking the API
+        self.assertEqual(manager.get_batch_status()[0], 'completed')
+        self.assertEqual(manager.client.calls, [])
+
+    def test_adopted_ids_survive_a_new_manager(self):
+        donor = self.submit_donor()
+        self.make_manager('job_1', input_jsonl_path=self.write_input('copy')).upload_file()
+
+        manager = self.make_manager('job_1', input_jsonl_path=self.write_input('copy'))
+        self.assertEqual((manager.batch_input_file_id, manager.openai_batch_id, manager.openai_output_file_id),
+                         (donor.batch_input_file_id, donor.openai_batch_id, 'file-output'))
+
+    def test_running_batch_is_adopted_without_output(self):
+        donor = self.submit_donor(status='in_progress', output_file_id=None)
+
+        manager = self.make_manager('job_1', input_jsonl_path=self.write_input('copy'))
+        manager.create_batch()
+
+        self.assertEqual(manager.client.calls, [])
+        self.assertEqual((manager.openai_batch_id, manager.openai_output_file_id), (donor.openai_batch_id, None))
+
+    def test_unusable_batch_is_not_adopted(self):
+        for status in ('failed', 'expired', 'cancelled', 'cancelling'):
+            with self.subTest(status=status):
+                content = f'{{"custom_id": "{status}"}}\n'
+                self.submit_donor(status=status, output_file_id=None, job_id=f'donor_{status}', content=content)
+
+                manager = self.make_manager(f'job_{status}', input_jsonl_path=self.write_input(f'copy_{status}', content))
+                manager.upload_file()
+                manager.create_batch()
+
+                self.assertEqual(manager.client.names(), ['files.create', 'batches.create'])
+
+    def test_different_input_is_not_adopted(self):
+        self.submit_donor()
+
+        manager = self.make_manager('job_1', input_jsonl_path=self.write_input('other', '{"custom_id": "b"}\n'))
+        manager.upload_file()
+
+        self.assertEqual(manager.client.names(), ['files.create'])
+
+def output_line(custom_id, message, prompt_tokens=10, completion_tokens=3):
+    """One line of a batch output file, as OpenAI writes it."""
+    return json.dumps({
+        'id': f'batch_req_{custom_id}',
+        'custom_id': custom_id,
+        'response': {
+            'status_code': 200,
+            'body': {
+                'model': 'gpt-4o-2024-08-06',
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': json.dumps(message)}}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens},
+            },
+        },
+        'error': None,
+    })
+
+OUTPUT_FILE = '\n'.join([
+    output_line('id-0', {'label': 'hiring', 'score': 0.9}),
+    '',
+    output_line('id-1', {'label': 'caf\u00e9 "quoted"', 'reason': 'multi\nline'}, prompt_tokens=12, completion_tokens=5),
+    '   ',
+    output_line('id-2', {'score': 0.1}),
+]) + '\n\n'
+
+class TestRegulateOutput(BatchManagerTestCase):
+
+    def check_output(self, df):
+        self.assertListEqual(list(df.columns), ['custom_id', 'model', 'prompt_tokens', 'completion_tokens', 'label', 'score', 'reason'])
+        self.assertListEqual(df['custom_id'].tolist(), ['id-0', 'id-1', 'id-2'])
+        self.assertListEqual(df['model'].tolist(), ['gpt-4o-2024-08-06'] * 3)
+        self.assertListEqual(df['prompt_tokens'].tolist(), [10, 12, 10])
+        self.assertListEqual(df['completion_tokens'].tolist(), [3, 5, 3])
+        # keys missing from a response message are left empty
+        self.assertEqual(df['label'].tolist()[:2], ['hiring', 'caf\u00e9 "quoted"'])
+        self.assertTrue(pd.isna(df['label'].iloc[2]))
+        self.assertEqual(df['score'].iloc[0], 0.9)
+        self.assertTrue(math.isnan(df['score'].iloc[1]))
+        self.assertEqual(df['score'].iloc[2], 0.1)
+        self.assertEqual(df['reason'].iloc[1], 'multi\nline')
+        self.assertTrue(pd.isna(df['reason'].iloc[0]) and pd.isna(df['reason'].iloc[2]))
+
+    def test_str_output(self):
+        self.check_output(self.make_manager('job_0')._regulate_output(OUTPUT_FILE))
+
+    def test_bytes_output(self):
+        self.check_output(self.make_manager('job_0')._regulate_output(OUTPUT_FILE.encode('utf-8')))
+
+    def test_get_output_file_saves_and_parses_the_same_bytes(self):
+        manager = self.make_manager('job_0')
+        manager.openai_output_file_id = 'file-output'
+        manager.client.files.content = lambda file_id: SimpleNamespace(read=lambda: OUTPUT_FILE.encode('utf-8'))
+
+        parquet_path, jsonl_path = manager.get_output_file()
+
+        with open(jsonl_path, 'rb') as f:
+            self.assertEqual(f.read(), OUTPUT_FILE.encode('utf-8'))
+        self.check_output(pd.read_parquet(parquet_path))
+
+if __name__ == '__main__':
+    unittest.main()
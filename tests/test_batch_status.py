@@ -0,0 +1,202 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import duckdb
+from openai_batch_wrapper import batch_manager
+from openai_batch_wrapper.batch_manager import BatchManager
+
+T0 = datetime(2025, 1, 1, 12, 0, 0)
+
+class TestBatchStatusLatest(unittest.TestCase):
+    """batch_status_latest must always agree with the history in batch_status."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.db_path = os.path.join(self.tmp_dir, 'batch_status.db')
+        self.input_path = os.path.join(self.tmp_dir, 'input.jsonl')
+        with open(self.input_path, 'w') as f:
+            f.write('{}\n')
+
+    def make_manager(self, job_id):
+        manager = BatchManager(
+            job_id=job_id,
+            input_jsonl_path=self.input_path,
+            output_path=self.tmp_dir,
+            api_key='test',
+            db_path=self.db_path,
+            verbose=False,
+        )
+        self.addCleanup(manager.close)
+        return manager
+
+    def can_open_from_other_process(self):
+        return subprocess.run(
+            [sys.executable, '-c', 'import sys, duckdb; duckdb.connect(sys.argv[1]).close()', self.db_path],
+            capture_output=True,
+        ).returncode == 0
+
+    def latest(self, manager, job_id):
+        return manager.db.execute("""
+            SELECT openai_file_id, openai_batch_id, updated_at, status, message, progress, openai_output_file_id
+            FROM batch_status_latest
+            WHERE job_id = ?
+        """, (job_id,)).fetchone()
+
+    def test_ids_keep_last_value_and_rest_follows_latest_row(self):
+        manager = self.make_manager('job_0')
+        rows = [
+            {'openai_file_id': 'file-0', 'status': 'uploaded'},
+            {'openai_batch_id': 'batch-0', 'status': 'validating', 'message': 'queued'},
+            {'status': 'in_progress', 'progress': 'Completed: 1;Failed: 0;Total: 2'},
+            {'status': 'completed', 'openai_output_file_id': 'out-0'},
+            {'status': 'completed'},
+        ]
+        with batch_manager._batched_status_writes([manager]):
+            for i, row in enumerate(rows):
+                manager._update_batch_status({'job_id': 'job_0', 'updated_at': T0 + timedelta(seconds=i), **row})
+
+        file_id, batch_id, updated_at, status, message, progress, output_file_id = self.latest(manager, 'job_0')
+        self.assertEqual((file_id, batch_id, output_file_id), ('file-0', 'batch-0', 'out-0'))
+        self.assertEqual(updated_at, T0 + timedelta(seconds=4))
+        self.assertEqual(status, 'completed')
+        # message and progress are taken from the latest row even when it has none
+        self.assertIsNone(message)
+        self.assertIsNone(progress)
+        self.assertEqual(manager.db.execute("SELECT COUNT(*) FROM batch_status").fetchone()[0], len(rows))
+
+    def test_ids_survive_later_writes(self):
+        manager = self.make_manager('job_0')
+        manager._update_batch_status({'job_id': 'job_0', 'openai_file_id': 'file-0', 'status': 'uploaded', 'updated_at': T0})
+        manager._update_batch_status({'job_id': 'job_0', 'openai_batch_id': 'batch-0', 'status': 'validating', 'message': 'queued', 'updated_at': T0 + timedelta(seconds=1)})
+        manager._update_batch_status({'job_id': 'job_0', 'status': 'in_progress', 'updated_at': T0 + timedelta(seconds=2)})
+
+        file_id, batch_id, updated_at, status, message, _, output_file_id = self.latest(manager, 'job_0')
+        self.assertEqual((file_id, batch_id, output_file_id), ('file-0', 'batch-0', None))
+        self.assertEqual(updated_at, T0 + timedelta(seconds=2))
+        self.assertEqual(status, 'in_progress')
+        self.assertIsNone(message)
+
+    def test_equal_timestamps_resolve_in_write_order(self):
+        manager = self.make_manager('job_0')
+        with batch_manager._batched_status_writes([manager]):
+            for status in ('validating', 'in_progress', 'finalizing'):
+                manager._update_batch_status({'job_id': 'job_0', 'status': status, 'updated_at': T0})
+
+        self.assertEqual(self.latest(manager, 'job_0')[3], 'finalizing')
+
+    def test_jobs_are_kept_apart(self):
+        manager = self.make_manager('job_0')
+        with batch_manager._batched_status_writes([manager]):
+            for i in range(3):
+                for job_id in ('job_0', 'job_1'):
+                    manager._update_batch_status({
+                        'job_id': job_id,
+                        'openai_batch_id': f'batch-{job_id}',
+                        'status': f'{job_id}-{i}',
+                        'updated_at': T0 + timedelta(seconds=i),
+                    })
+
+        for job_id in ('job_0', 'job_1'):
+            _, batch_id, _, status, _, _, _ = self.latest(manager, job_id)
+            self.assertEqual((batch_id, status), (f'batch-{job_id}', f'{job_id}-2'))
+
+    def test_rows_are_written_immediately(self):
+        manager = self.make_manager('job_0')
+        manager._update_batch_status({'job_id': 'job_0', 'status': 'validating', 'updated_at': T0})
+
+        # another cursor sees the row without the manager being closed
+        other = duckdb.connect(manager.db_path)
+        self.assertEqual(other.execute("SELECT status FROM batch_status_latest").fetchall(), [('validating',)])
+        self.assertEqual(other.execute("SELECT COUNT(*) FROM batch_status").fetchone()[0], 1)
+        other.close()
+
+    def test_batched_rows_are_written_when_the_block_ends(self):
+        managers = [self.make_manager('job_0'), self.make_manager('job_1')]
+        with batch_manager._batched_status_writes(managers):
+            for manager in managers:
+                manager._update_batch_status({'job_id': manager.job_id, 'status': 'validating', 'updated_at': T0})
+            self.assertIsNone(self.latest(managers[0], 'job_0'))
+
+        for manager in managers:
+            self.assertEqual(self.latest(manager, manager.job_id)[3], 'validating')
+            self.assertIsNone(manager._pending_status_rows)
+
+    def test_file_lock_is_released_when_the_last_manager_closes(self):
+        first, second = self.make_manager('job_0'), self.make_manager('job_1')
+        self.assertIs(batch_manager._dbs[first.db_path][0], batch_manager._dbs[second.db_path][0])
+
+        first.close()
+        self.assertFalse(self.can_open_from_other_process())
+        second.close()
+        self.assertNotIn(second.db_path, batch_manager._dbs)
+        self.assertTrue(self.can_open_from_other_process())
+
+        # closing twice does not give up a use that somebody else holds
+        third = self.make_manager('job_2')
+        first.close()
+        self.assertEqual(third.db.execute("SELECT COUNT(*) FROM batch_status_latest").fetchone()[0], 0)
+
+    def test_status_writes_do_not_hash_the_input(self):
+        manager = self.make_manager('job_0')
+        manager._update_batch_status({'job_id': 'job_0', 'status': 'in_progress'})
+        self.assertNotIn('input_hash', vars(manager))
+
+        # a later status row keeps the hash recorded at submission
+        manager._update_batch_status({'job_id': 'job_0', 'status': 'uploaded', 'input_hash': manager.input_hash})
+        manager._update_batch_status({'job_id': 'job_0', 'status': 'in_progress'})
+        self.assertEqual(manager.db.execute("SELECT input_hash FROM batch_status_latest").fetchone()[0], manager.input_hash)
+
+    def test_dropped_manager_releases_the_file(self):
+        manager = BatchManager(job_id='job_0', input_jsonl_path=self.input_path, output_path=self.tmp_dir, api_key='test', db_path=self.db_path, verbose=False)
+        manager._update_batch_status({'job_id': 'job_0', 'status': 'validating'})
+        del manager
+        self.assertTrue(self.can_open_from_other_process())
+
+    def test_latest_table_is_derived_from_older_history(self):
+        # a database written before input hashing and before batch_status_latest existed
+        with duckdb.connect(self.db_path) as db:
+            db.execute("""
+                CREATE TABLE batch_status (
+                    job_id VARCHAR,
+                    openai_file_id VARCHAR,
+                    openai_batch_id VARCHAR,
+                    updated_at TIMESTAMP,
+                    status VARCHAR,
+                    message VARCHAR,
+                    progress CHAR(255),
+                    openai_output_file_id VARCHAR
+                )
+            """)
+            # rows are inserted out of order, the history is folded by updated_at
+            db.executemany("INSERT INTO batch_status VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+                ('job_0', None, 'batch-0', T0 + timedelta(seconds=1), 'validating', 'queued', None, None),
+                ('job_0', None, None, T0 + timedelta(seconds=3), 'completed', None, 'done', 'out-0'),
+                ('job_0', 'file-0', None, T0, 'uploaded', None, None, None),
+                ('job_1', 'file-1', None, T0, 'uploaded', None, None, None),
+                ('job_0', None, None, T0 + timedelta(seconds=2), 'in_progress', None, 'half', None),
+            ])
+
+        manager = self.make_manager('job_0')
+        self.assertEqual((manager.batch_input_file_id, manager.openai_batch_id, manager.openai_output_file_id), ('file-0', 'batch-0', 'out-0'))
+
+        file_id, batch_id, updated_at, status, message, progress, output_file_id = self.latest(manager, 'job_0')
+        self.assertEqual((file_id, batch_id, output_file_id), ('file-0', 'batch-0', 'out-0'))
+        self.assertEqual((updated_at, status, message, progress.strip()), (T0 + timedelta(seconds=3), 'completed', None, 'done'))
+        file_id, batch_id, _, status, _, _, _ = self.latest(manager, 'job_1')
+        self.assertEqual((file_id, batch_id, status), ('file-1', None, 'uploaded'))
+
+        # the migrated database keeps accepting new rows, including the added input_hash column
+        manager._update_batch_status({'job_id': 'job_1', 'openai_batch_id': 'batch-1', 'status': 'validating', 'input_hash': manager.input_hash})
+        self.assertEqual(self.latest(manager, 'job_1')[:2], ('file-1', 'batch-1'))
+        self.assertEqual(manager.db.execute(
+            "SELECT input_hash FROM batch_status_latest WHERE job_id = 'job_1'"
+        ).fetchone()[0], manager.input_hash)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import importlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+
+import pandas as pd
+
+from openai_batch_wrapper import preprocess
+from openai_batch_wrapper.preprocess import _uuid4_strings
+
+UUID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}$')
+
+class TestUuid4Strings(unittest.TestCase):
+
+    def test_format(self):
+        ids = _uuid4_strings(1000)
+        self.assertEqual(ids.shape, (1000,))
+        for value in ids:
+            self.assertIsInstance(value, str)
+            self.assertRegex(value, UUID_PATTERN)
+
+    def test_version_and_variant(self):
+        for value in _uuid4_strings(1000):
+            parsed = uuid.UUID(value)
+            self.assertEqual(parsed.version, 4)
+            self.assertEqual(parsed.variant, uuid.RFC_4122)
+            # round-trips to the same canonical string
+            self.assertEqual(str(parsed), value)
+
+    def test_unique(self):
+        ids = _uuid4_strings(10000)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_empty(self):
+        ids = _uuid4_strings(0)
+        self.assertEqual(ids.shape, (0,))
+        self.assertEqual(list(ids), [])
+
+class StubEncoding:
+    """Byte-level stand-in for a tiktoken encoding, which cannot be downloaded in tests."""
+
+    def encode(self, text):
+        return list(text.encode('utf-8'))
+
+    def encode_batch(self, texts, num_threads=1):
+        return [self.encode(text) for text in texts]
+
+GUIDING_PROMPT = 'Classify the question.\n"Answer" in JSON \\ nothing else \u00e9'
+
+CONTENTS = [
+    'plain question',
+    'with "double quotes" and \'single quotes\'',
+    'back\\slash \\n not a newline \\u0041',
+    'multi\nline\r\ntext\twith tab',
+    'non-ASCII: caf\u00e9, \u4e2d\u6587, \U0001f600, \u2028 line separator, \x00 nul',
+]
+
+SCHEMA = {
+    'name': 'classification',
+    'schema': {'type': 'object', 'properties': {'label': {'type': 'string', 'description': 'sp\u00e9cial "label"'}}},
+}
+
+try:
+    import orjson  # noqa: F401
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+class TestPreprocessDataframe(unittest.TestCase):
+    """Every JSONL line must parse to the request the original per-row loop built."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.schema_path = os.path.join(self.tmp_dir, 'schema.json')
+        with open(self.schema_path, 'w') as f:
+            json.dump(SCHEMA, f)
+
+    def without_orjson(self):
+        with mock.patch.dict(sys.modules, {'orjson': None}):
+            importlib.reload(preprocess)
+        self.addCleanup(importlib.reload, preprocess)
+        self.assertIsNone(preprocess.orjson)
+
+    def expected_request(self, custom_id, content, structured):
+        body = {
+            "model": 'gpt-4o',
+            "temperature": 0,
+            "messages": [{"role": "system", "content": GUIDING_PROMPT}, {"role": "user", "content": content}],
+        }
+        if structured:
+            body["response_format"] = {"type": "json_schema", "json_schema": SCHEMA}
+        return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+    def check_requests(self, structured):
+        output_dir = os.path.join(self.tmp_dir, 'test_output')
+        df = pd.DataFrame({'question': CONTENTS, 'other': range(len(CONTENTS))}, index=range(10, 10 + len(CONTENTS)))
+        with mock.patch.object(preprocess, '_get_encoding', return_value=StubEncoding()):
+            jsonl_paths = preprocess.preprocess_dataframe(
+                df=df,
+                guiding_prompt=GUIDING_PROMPT,
+                content_col='question',
+                chunk_size=2,
+                output_dir=output_dir,
+                llm_model='gpt-4o',
+                structured_output_path=self.schema_path if structured else None,
+            )
+
+        indexed = pd.read_parquet(os.path.join(output_dir, 'indexed_input_data', 'indexed_df.parquet'))
+        self.assertEqual(jsonl_paths, [os.path.join(output_dir, 'jsonl', f'job_{job_id}.jsonl') for job_id in range(3)])
+        for job_id, job_df in indexed.groupby('job_id'):
+            with open(jsonl_paths[job_id], 'rb') as f:
+                lines = f.read().split(b'\n')
+            # one request per line and a trailing newline, content newlines stay escaped
+            self.assertEqual(lines[-1], b'')
+            self.assertEqual(len(lines) - 1, len(job_df))
+            for line, (_, row) in zip(lines, job_df.iterrows()):
+                self.assertEqual(json.loads(line), self.expected_request(row['bash_custom_id'], row['question'], structured))
+
+    @unittest.skipUnless(HAS_ORJSON, 'orjson is not installed')
+    def test_requests_with_orjson(self):
+        self.check_requests(structured=False)
+
+    @unittest.skipUnless(HAS_ORJSON, 'orjson is not installed')
+    def test_structured_requests_with_orjson(self):
+        self.check_requests(structured=True)
+
+    def test_requests_without_orjson(self):
+        self.without_orjson()
+        self.check_requests(structured=False)
+
+    def test_structured_requests_without_orjson(self):
+        self.without_orjson()
+        self.check_requests(structured=True)
+
+if __name__ == '__main__':
+    unittest.main()
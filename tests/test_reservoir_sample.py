@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from openai_batch_wrapper.preprocess import reservoir_sample
+
+def make_chunks(n_rows, batch_size):
+    """Split a frame of n_rows uniquely numbered rows into batches."""
+    df = pd.DataFrame({'row': np.arange(n_rows)}, index=np.arange(n_rows) * 10)
+    return [df.iloc[start:start + batch_size] for start in range(0, n_rows, batch_size)]
+
+class TestReservoirSample(unittest.TestCase):
+
+    def test_sample_size_and_uniqueness(self):
+        # batches smaller than the reservoir, so rows of many batches survive and the pieces get compacted
+        chunks = make_chunks(5000, 37)
+        sample, n_seen = reservoir_sample(iter(chunks), 50, np.random.default_rng(0))
+
+        self.assertEqual(n_seen, 5000)
+        self.assertEqual(len(sample), 50)
+        self.assertTrue(sample['row'].is_unique)
+        self.assertTrue(sample.index.is_unique)
+        # rows are passed through untouched, with their original index
+        pd.testing.assert_index_equal(sample.index, pd.Index(sample['row'].to_numpy() * 10))
+
+    def test_batches_larger_than_reservoir(self):
+        sample, n_seen = reservoir_sample(iter(make_chunks(3000, 1000)), 100, np.random.default_rng(0))
+
+        self.assertEqual((len(sample), n_seen), (100, 3000))
+        self.assertTrue(sample['row'].is_unique)
+
+    def test_fewer_rows_than_reservoir(self):
+        chunks = make_chunks(30, 7)
+        sample, n_seen = reservoir_sample(iter(chunks), 50, np.random.default_rng(0))
+
+        self.assertEqual(n_seen, 30)
+        self.assertListEqual(sample['row'].tolist(), list(range(30)))
+
+    def test_empty_input(self):
+        empty = pd.DataFrame({'row': np.arange(0)})
+        sample, n_seen = reservoir_sample(iter([empty, empty]), 10, np.random.default_rng(0))
+
+        self.assertEqual((len(sample), n_seen), (0, 0))
+
+    def test_every_row_is_equally_likely(self):
+        n_rows, sample_size, trials = 40, 10, 2000
+        rng = np.random.default_rng(1)
+        counts = np.zeros(n_rows)
+        # uneven batches, including an empty one, exercise the slot bookkeeping
+        df = make_chunks(n_rows, n_rows)[0]
+        bounds = [0, 7, 7, 20, 23, 31, n_rows]
+        chunks = [df.iloc[start:end] for start, end in zip(bounds, bounds[1:])]
+        for _ in range(trials):
+            sample, _ = reservoir_sample(iter(chunks), sample_size, rng)
+            counts[sample['row'].to_numpy()] += 1
+
+        # each row is expected in a quarter of the samples, the standard error is about 0.01
+        np.testing.assert_allclose(counts / trials, sample_size / n_rows, atol=0.05)
+
+if __name__ == '__main__':
+    unittest.main()